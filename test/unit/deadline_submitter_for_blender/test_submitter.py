@@ -2,8 +2,14 @@
 
 """Test the Deadline Cloud Blender Submitter."""
 
+import copy
+import dataclasses
+import functools
+import importlib.util
+import string
 import sys
 from pathlib import Path
+from typing import Any
 
 import pytest
 from unittest.mock import Mock, patch
@@ -15,27 +21,262 @@ from deadline.blender_submitter.addons.deadline_cloud_blender_submitter.open_dea
 
 from deadline.client.exceptions import DeadlineOperationError
 
-# Ensure the submitter can be imported.
-SUBMITTER_DIR = (
-    Path(__file__).parent.parent.parent.parent
+# Load the submitter's template_filling module straight from its file instead of adding the addon
+# directory to `sys.path`. It is registered under a private name since `dataclass` looks up the
+# defining module in `sys.modules`.
+_TEMPLATE_FILLING_PATH = (
+    Path(__file__).resolve().parents[3]
     / "src"
     / "deadline"
     / "blender_submitter"
     / "addons"
     / "deadline_cloud_blender_submitter"
+    / "template_filling.py"
 )
-sys.path.append(str(SUBMITTER_DIR))
-import template_filling  # noqa: E402
+_spec = importlib.util.spec_from_file_location(
+    "_test_submitter_template_filling", _TEMPLATE_FILLING_PATH
+)
+assert _spec is not None and _spec.loader is not None
+template_filling = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = template_filling
+_spec.loader.exec_module(template_filling)
+
+_INIT_DATA_TMPL = string.Template(
+    "scene_file: {{Param.BlenderFile}}\nrender_engine: {{Param.RenderEngine}}\nrender_scene: {{Param.RenderScene}}\nview_layer: $view_layer\noutput_dir: {{Param.OutputDir}}\noutput_file_name: {{Param.OutputFileName}}\noutput_format: {{Param.OutputFormat}}\nrenderer: dummy_renderer\noutput_file_prefix: {{Param.OutputFilePrefix}}\nimage_width: {{Param.ImageWidth}}\nimage_height: {{Param.ImageHeight}}"
+)
+
+# The body of a single step in the default template. Every layer produces one of these, differing
+# only in the step name and the view layer written to the init data.
+_EXPECTED_STEP_TEMPLATE: dict[str, Any] = {
+    "name": None,
+    "parameterSpace": {
+        "taskParameterDefinitions": [
+            {"name": "Frame", "type": "INT", "range": "{{Param.Frames}}"},
+            {"name": "Camera", "type": "STRING", "range": ["Camera"]},
+        ]
+    },
+    "stepEnvironments": [
+        {
+            "name": "Blender",
+            "description": "Runs Blender in the background.",
+            "script": {
+                "embeddedFiles": [
+                    {
+                        "name": "initData",
+                        "filename": "init-data.yaml",
+                        "type": "TEXT",
+                        "data": None,
+                    }
+                ],
+                "actions": {
+                    "onEnter": {
+                        "command": "blender-openjd",
+                        "args": [
+                            "daemon",
+                            "start",
+                            "--connection-file",
+                            "{{Session.WorkingDirectory}}/connection.json",
+                            "--init-data",
+                            "file://{{Env.File.initData}}",
+                        ],
+                        "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
+                    },
+                    "onExit": {
+                        "command": "blender-openjd",
+                        "args": [
+                            "daemon",
+                            "stop",
+                            "--connection-file",
+                            "{{ Session.WorkingDirectory }}/connection.json",
+                        ],
+                        "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
+                    },
+                },
+            },
+        }
+    ],
+    "script": {
+        "embeddedFiles": [
+            {
+                "name": "runData",
+                "filename": "run-data.yaml",
+                "type": "TEXT",
+                "data": "frame: {{Task.Param.Frame}}\ncamera: '{{Task.Param.Camera}}'\n",
+            }
+        ],
+        "actions": {
+            "onRun": {
+                "command": "blender-openjd",
+                "args": [
+                    "daemon",
+                    "run",
+                    "--connection-file",
+                    "{{ Session.WorkingDirectory }}/connection.json",
+                    "--run-data",
+                    "file://{{ Task.File.runData }}",
+                ],
+                "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
+            }
+        },
+    },
+}
+
+_EXPECTED_TEMPLATE: dict[str, Any] = {
+    "specificationVersion": "jobtemplate-2023-09",
+    "name": "Blender Submission",
+    "description": None,
+    "parameterDefinitions": [
+        {
+            "name": "BlenderFile",
+            "type": "PATH",
+            "objectType": "FILE",
+            "dataFlow": "IN",
+            "userInterface": {
+                "control": "CHOOSE_INPUT_FILE",
+                "label": "Blender File",
+                "fileFilters": [
+                    {"label": "Blender Files", "patterns": ["*.blend"]},
+                    {"label": "All Files", "patterns": ["*"]},
+                ],
+            },
+            "description": "Choose the Blender scene file you want to render.",
+        },
+        {
+            "name": "RenderEngine",
+            "type": "STRING",
+            "default": "cycles",
+            "allowedValues": ["eevee", "workbench", "cycles"],
+        },
+        {
+            "name": "RenderScene",
+            "type": "STRING",
+            "userInterface": {
+                "control": "LINE_EDIT",
+                "label": "Scene",
+                "groupLabel": "Blender Settings",
+            },
+            "default": "Scene",
+            "description": "The scene you want to render (scene name).",
+        },
+        {
+            "name": "ViewLayer",
+            "type": "STRING",
+            "userInterface": {"control": "LINE_EDIT", "label": "view_layer"},
+            "description": "Choose the layer to render.",
+            "default": "ViewLayer",
+        },
+        {
+            "name": "Frames",
+            "type": "STRING",
+            "userInterface": {
+                "control": "LINE_EDIT",
+                "label": "Frames",
+                "groupLabel": "Blender Settings",
+            },
+            "default": "1-1",
+            "description": "The frames to render. E.g. 1-3,8,11-15",
+        },
+        {
+            "name": "OutputDir",
+            "type": "PATH",
+            "objectType": "DIRECTORY",
+            "dataFlow": "OUT",
+            "userInterface": {"control": "CHOOSE_DIRECTORY", "label": "Output Directory"},
+            "description": "Choose the render output directory.",
+        },
+        {
+            "name": "OutputFileName",
+            "type": "STRING",
+            "userInterface": {"control": "LINE_EDIT", "label": "Output File Name"},
+            "default": "output_####",
+            "description": "Enter the output filename (without extension).",
+        },
+        {
+            "name": "OutputFormat",
+            "type": "STRING",
+            "userInterface": {"control": "DROPDOWN_LIST", "label": "Output File Format"},
+            "description": "Choose the file format to render as.",
+            "default": "PNG",
+            "allowedValues": [
+                "TARGA",
+                "TARGA_RAW",
+                "JPEG",
+                "IRIS",
+                "PNG",
+                "HDR",
+                "TIFF",
+                "OPEN_EXR",
+                "OPEN_EXR_MULTILAYER",
+                "CINEON",
+                "DPX",
+                "JPEG2000",
+                "WEBP",
+            ],
+        },
+        {
+            "name": "StrictErrorChecking",
+            "type": "STRING",
+            "userInterface": {
+                "control": "CHECK_BOX",
+                "label": "Strict Error Checking",
+                "groupLabel": "Blender Settings",
+            },
+            "description": "Fail when errors occur.",
+            "default": "false",
+            "allowedValues": ["true", "false"],
+        },
+        {
+            "name": None,
+            "type": "INT",
+            "userInterface": {
+                "control": "SPIN_BOX",
+                "label": "Image Width",
+                "groupLabel": "dummy_group_label",
+            },
+            "minValue": 1,
+            "description": "The image width.",
+        },
+        {
+            "name": None,
+            "type": "INT",
+            "userInterface": {
+                "control": "SPIN_BOX",
+                "label": "Image Height",
+                "groupLabel": "dummy_group_label",
+            },
+            "minValue": 1,
+            "description": "The image height.",
+        },
+    ],
+}
+
 
+@functools.lru_cache(maxsize=None)
+def _build_expected(layer_names):
+    """Return the job template expected from filling the default template with the given layers.
 
-@pytest.fixture
+    The result is cached and shared between callers, so treat it as read-only.
+    """
+    expected = copy.deepcopy(_EXPECTED_TEMPLATE)
+    expected["steps"] = []
+    for name in layer_names:
+        step = copy.deepcopy(_EXPECTED_STEP_TEMPLATE)
+        step["name"] = name
+        step["stepEnvironments"][0]["script"]["embeddedFiles"][0]["data"] = (
+            _INIT_DATA_TMPL.substitute(view_layer=name)
+        )
+        expected["steps"].append(step)
+    return expected
+
+
+@pytest.fixture(scope="session")
 def submitter_settings():
     """Return a submitter settings object."""
     settings = template_filling.BlenderSubmitterUISettings()
     return settings
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def common_layer_settings():
     """Return a common layer settings object."""
     settings = template_filling.CommonLayerSettings(
@@ -52,11 +293,10 @@ def common_layer_settings():
         image_resolution=(1920, 1080),
         scene_name="dummy_scene_name",
     )
-    print(settings)
     return settings
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def layers(common_layer_settings):
     return [
         template_filling.Layer("layer_1", common_layer_settings),
@@ -69,284 +309,8 @@ def test_fill_job_template(submitter_settings, layers):
 
     # NOTE This is not the most elegant way to test this; brittle to changes in the template.
 
-    expected = {
-        "specificationVersion": "jobtemplate-2023-09",
-        "name": "Blender Submission",
-        "description": None,
-        "parameterDefinitions": [
-            {
-                "name": "BlenderFile",
-                "type": "PATH",
-                "objectType": "FILE",
-                "dataFlow": "IN",
-                "userInterface": {
-                    "control": "CHOOSE_INPUT_FILE",
-                    "label": "Blender File",
-                    "fileFilters": [
-                        {"label": "Blender Files", "patterns": ["*.blend"]},
-                        {"label": "All Files", "patterns": ["*"]},
-                    ],
-                },
-                "description": "Choose the Blender scene file you want to render.",
-            },
-            {
-                "name": "RenderEngine",
-                "type": "STRING",
-                "default": "cycles",
-                "allowedValues": ["eevee", "workbench", "cycles"],
-            },
-            {
-                "name": "RenderScene",
-                "type": "STRING",
-                "userInterface": {
-                    "control": "LINE_EDIT",
-                    "label": "Scene",
-                    "groupLabel": "Blender Settings",
-                },
-                "default": "Scene",
-                "description": "The scene you want to render (scene name).",
-            },
-            {
-                "name": "ViewLayer",
-                "type": "STRING",
-                "userInterface": {"control": "LINE_EDIT", "label": "view_layer"},
-                "description": "Choose the layer to render.",
-                "default": "ViewLayer",
-            },
-            {
-                "name": "Frames",
-                "type": "STRING",
-                "userInterface": {
-                    "control": "LINE_EDIT",
-                    "label": "Frames",
-                    "groupLabel": "Blender Settings",
-                },
-                "default": "1-1",
-                "description": "The frames to render. E.g. 1-3,8,11-15",
-            },
-            {
-                "name": "OutputDir",
-                "type": "PATH",
-                "objectType": "DIRECTORY",
-                "dataFlow": "OUT",
-                "userInterface": {"control": "CHOOSE_DIRECTORY", "label": "Output Directory"},
-                "description": "Choose the render output directory.",
-            },
-            {
-                "name": "OutputFileName",
-                "type": "STRING",
-                "userInterface": {"control": "LINE_EDIT", "label": "Output File Name"},
-                "default": "output_####",
-                "description": "Enter the output filename (without extension).",
-            },
-            {
-                "name": "OutputFormat",
-                "type": "STRING",
-                "userInterface": {"control": "DROPDOWN_LIST", "label": "Output File Format"},
-                "description": "Choose the file format to render as.",
-                "default": "PNG",
-                "allowedValues": [
-                    "TARGA",
-                    "TARGA_RAW",
-                    "JPEG",
-                    "IRIS",
-                    "PNG",
-                    "HDR",
-                    "TIFF",
-                    "OPEN_EXR",
-                    "OPEN_EXR_MULTILAYER",
-                    "CINEON",
-                    "DPX",
-                    "JPEG2000",
-                    "WEBP",
-                ],
-            },
-            {
-                "name": "StrictErrorChecking",
-                "type": "STRING",
-                "userInterface": {
-                    "control": "CHECK_BOX",
-                    "label": "Strict Error Checking",
-                    "groupLabel": "Blender Settings",
-                },
-                "description": "Fail when errors occur.",
-                "default": "false",
-                "allowedValues": ["true", "false"],
-            },
-            {
-                "name": None,
-                "type": "INT",
-                "userInterface": {
-                    "control": "SPIN_BOX",
-                    "label": "Image Width",
-                    "groupLabel": "dummy_group_label",
-                },
-                "minValue": 1,
-                "description": "The image width.",
-            },
-            {
-                "name": None,
-                "type": "INT",
-                "userInterface": {
-                    "control": "SPIN_BOX",
-                    "label": "Image Height",
-                    "groupLabel": "dummy_group_label",
-                },
-                "minValue": 1,
-                "description": "The image height.",
-            },
-        ],
-        "steps": [
-            {
-                "name": "layer_1",
-                "parameterSpace": {
-                    "taskParameterDefinitions": [
-                        {"name": "Frame", "type": "INT", "range": "{{Param.Frames}}"},
-                        {"name": "Camera", "type": "STRING", "range": ["Camera"]},
-                    ]
-                },
-                "stepEnvironments": [
-                    {
-                        "name": "Blender",
-                        "description": "Runs Blender in the background.",
-                        "script": {
-                            "embeddedFiles": [
-                                {
-                                    "name": "initData",
-                                    "filename": "init-data.yaml",
-                                    "type": "TEXT",
-                                    "data": "scene_file: {{Param.BlenderFile}}\nrender_engine: {{Param.RenderEngine}}\nrender_scene: {{Param.RenderScene}}\nview_layer: layer_1\noutput_dir: {{Param.OutputDir}}\noutput_file_name: {{Param.OutputFileName}}\noutput_format: {{Param.OutputFormat}}\nrenderer: dummy_renderer\noutput_file_prefix: {{Param.OutputFilePrefix}}\nimage_width: {{Param.ImageWidth}}\nimage_height: {{Param.ImageHeight}}",
-                                }
-                            ],
-                            "actions": {
-                                "onEnter": {
-                                    "command": "blender-openjd",
-                                    "args": [
-                                        "daemon",
-                                        "start",
-                                        "--connection-file",
-                                        "{{Session.WorkingDirectory}}/connection.json",
-                                        "--init-data",
-                                        "file://{{Env.File.initData}}",
-                                    ],
-                                    "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                                },
-                                "onExit": {
-                                    "command": "blender-openjd",
-                                    "args": [
-                                        "daemon",
-                                        "stop",
-                                        "--connection-file",
-                                        "{{ Session.WorkingDirectory }}/connection.json",
-                                    ],
-                                    "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                                },
-                            },
-                        },
-                    }
-                ],
-                "script": {
-                    "embeddedFiles": [
-                        {
-                            "name": "runData",
-                            "filename": "run-data.yaml",
-                            "type": "TEXT",
-                            "data": "frame: {{Task.Param.Frame}}\ncamera: '{{Task.Param.Camera}}'\n",
-                        }
-                    ],
-                    "actions": {
-                        "onRun": {
-                            "command": "blender-openjd",
-                            "args": [
-                                "daemon",
-                                "run",
-                                "--connection-file",
-                                "{{ Session.WorkingDirectory }}/connection.json",
-                                "--run-data",
-                                "file://{{ Task.File.runData }}",
-                            ],
-                            "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                        }
-                    },
-                },
-            },
-            {
-                "name": "layer_2",
-                "parameterSpace": {
-                    "taskParameterDefinitions": [
-                        {"name": "Frame", "type": "INT", "range": "{{Param.Frames}}"},
-                        {"name": "Camera", "type": "STRING", "range": ["Camera"]},
-                    ]
-                },
-                "stepEnvironments": [
-                    {
-                        "name": "Blender",
-                        "description": "Runs Blender in the background.",
-                        "script": {
-                            "embeddedFiles": [
-                                {
-                                    "name": "initData",
-                                    "filename": "init-data.yaml",
-                                    "type": "TEXT",
-                                    "data": "scene_file: {{Param.BlenderFile}}\nrender_engine: {{Param.RenderEngine}}\nrender_scene: {{Param.RenderScene}}\nview_layer: layer_2\noutput_dir: {{Param.OutputDir}}\noutput_file_name: {{Param.OutputFileName}}\noutput_format: {{Param.OutputFormat}}\nrenderer: dummy_renderer\noutput_file_prefix: {{Param.OutputFilePrefix}}\nimage_width: {{Param.ImageWidth}}\nimage_height: {{Param.ImageHeight}}",
-                                }
-                            ],
-                            "actions": {
-                                "onEnter": {
-                                    "command": "blender-openjd",
-                                    "args": [
-                                        "daemon",
-                                        "start",
-                                        "--connection-file",
-                                        "{{Session.WorkingDirectory}}/connection.json",
-                                        "--init-data",
-                                        "file://{{Env.File.initData}}",
-                                    ],
-                                    "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                                },
-                                "onExit": {
-                                    "command": "blender-openjd",
-                                    "args": [
-                                        "daemon",
-                                        "stop",
-                                        "--connection-file",
-                                        "{{ Session.WorkingDirectory }}/connection.json",
-                                    ],
-                                    "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                                },
-                            },
-                        },
-                    }
-                ],
-                "script": {
-                    "embeddedFiles": [
-                        {
-                            "name": "runData",
-                            "filename": "run-data.yaml",
-                            "type": "TEXT",
-                            "data": "frame: {{Task.Param.Frame}}\ncamera: '{{Task.Param.Camera}}'\n",
-                        }
-                    ],
-                    "actions": {
-                        "onRun": {
-                            "command": "blender-openjd",
-                            "args": [
-                                "daemon",
-                                "run",
-                                "--connection-file",
-                                "{{ Session.WorkingDirectory }}/connection.json",
-                                "--run-data",
-                                "file://{{ Task.File.runData }}",
-                            ],
-                            "cancelation": {"mode": "NOTIFY_THEN_TERMINATE"},
-                        }
-                    },
-                },
-            },
-        ],
-    }
     filled = template_filling.fill_job_template(submitter_settings, layers, host_requirements=None)
-    assert filled == expected
+    assert filled == _build_expected(("layer_1", "layer_2"))
 
     # Adding host requirements to the call adds them to each step.
     host_reqs = {"GPU": "1"}
@@ -399,16 +363,16 @@ def test_get_param_values(submitter_settings, common_layer_settings):
     ]
 
     # IF `settings.include_adaptor_wheels` is False > keep "deadline_cloud_for_blender" in the final template
-    submitter_settings.include_adaptor_wheels = False
+    settings = dataclasses.replace(submitter_settings, include_adaptor_wheels=False)
     filled = template_filling.get_parameter_values(
-        submitter_settings, common_layer_settings, queue_params=queue_params
+        settings, common_layer_settings, queue_params=queue_params
     )
     assert filled[-1]["value"] == "some_other_package deadline_cloud_for_blender another_package"
 
     # IF `settings.include_adaptor_wheels` is True > remove "deadline_cloud_for_blender"
-    submitter_settings.include_adaptor_wheels = True
+    settings = dataclasses.replace(submitter_settings, include_adaptor_wheels=True)
     filled = template_filling.get_parameter_values(
-        submitter_settings, common_layer_settings, queue_params=queue_params
+        settings, common_layer_settings, queue_params=queue_params
     )
     assert filled[-1]["value"] == "some_other_package another_package"
 
@@ -423,13 +387,11 @@ def test_add_ocio_template_data(submitter_settings, common_layer_settings, layer
     expected_ocio_param = {"name": "OCIOConfigPath", "value": "my_ocio_config.ocio"}
 
     # GIVEN
-    submitter_settings.ocio_config_path = "my_ocio_config.ocio"
+    settings = dataclasses.replace(submitter_settings, ocio_config_path="my_ocio_config.ocio")
 
     # WHEN
-    filled_template = template_filling.fill_job_template(
-        submitter_settings, layers, host_requirements=None
-    )
-    params = template_filling.get_parameter_values(submitter_settings, common_layer_settings, [])
+    filled_template = template_filling.fill_job_template(settings, layers, host_requirements=None)
+    params = template_filling.get_parameter_values(settings, common_layer_settings, [])
 
     # THEN
     assert expected_ocio_env in filled_template["jobEnvironments"]